@@ -1,88 +1,136 @@
 #!/usr/bin/env python3
 """
 Simple Test Script for Astro Extension
-Tests basic functionality using local DuckDB binary
+Tests basic functionality using the DuckDB Python API
+
+Requires the `duckdb` pip package at the DuckDB version the extension is
+built against (DUCKDB_VERSION in extension_config.cmake), otherwise the
+extension will not LOAD.
 """
 
-import subprocess
+import re
 import sys
 from pathlib import Path
 
-def run_duckdb_query(query):
-    """Run a query using local DuckDB binary"""
-    duckdb_path = Path("./build/release/duckdb")
-    extension_path = Path("build/release/extension/astro/astro.duckdb_extension")
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
 
-    if not duckdb_path.exists():
-        print(f"❌ DuckDB binary not found: {duckdb_path}")
-        return None
+_EXTENSION_PATH = Path("build/release/extension/astro/astro.duckdb_extension")
+_EXT = str(_EXTENSION_PATH.resolve())
+_CONN = None
+
+def _ensure_extension():
+    """Fail fast if the extension has not been built"""
+    if not _EXTENSION_PATH.exists():
+        raise FileNotFoundError(f"Extension not found: {_EXTENSION_PATH}")
 
-    if not extension_path.exists():
-        print(f"❌ Extension not found: {extension_path}")
+def _required_duckdb_version():
+    """Read the DuckDB version the extension is built against"""
+    try:
+        config = Path("extension_config.cmake").read_text()
+    except OSError:
         return None
+    match = re.search(r'set\(DUCKDB_VERSION "v?([^"]+)"\)', config)
+    return match.group(1) if match else None
+
+def _ensure_duckdb():
+    """Fail fast if the DuckDB Python package is not installed"""
+    # Without the pip package, `import duckdb` from the repo root picks up
+    # the duckdb/ submodule as an empty namespace package
+    if not hasattr(duckdb, "connect"):
+        version = _required_duckdb_version()
+        package = f"duckdb=={version}" if version else "duckdb"
+        raise ImportError(f"DuckDB Python package not found, run: pip install {package}")
+
+def get_connection():
+    """Open the shared DuckDB connection and load the extension once"""
+    global _CONN
+    if _CONN is not None:
+        return _CONN
 
     try:
-        # Load extension and run query
-        full_query = f"LOAD '{extension_path.absolute()}'; {query}"
-        cmd = [str(duckdb_path), "-unsigned", "-c", full_query]
-        result = subprocess.run(cmd, capture_output=True, text=True, cwd=Path.cwd())
+        conn = duckdb.connect(config={'allow_unsigned_extensions': 'true'})
+        conn.execute(f"LOAD '{_EXT}'")
+    except Exception as e:
+        print(f"❌ Failed to load extension: {e}")
+        return None
+
+    _CONN = conn
+    return _CONN
 
-        if result.returncode != 0:
-            print(f"❌ DuckDB error: {result.stderr}")
-            return None
+def run_duckdb_query(query):
+    """Run a query on the shared in-process DuckDB connection"""
+    conn = get_connection()
+    if conn is None:
+        return None
 
-        return result.stdout.strip()
+    try:
+        return conn.execute(query).fetchone()
     except Exception as e:
         print(f"❌ Failed to run query: {e}")
         return None
 
+def run_checks(exprs):
+    """Evaluate expressions in one SELECT, returning (value, error) per expression"""
+    conn = get_connection()
+    try:
+        row = conn.execute(f"SELECT {', '.join(exprs)}").fetchone()
+        return [(value, None) for value in row]
+    except Exception:
+        pass
+
+    # The batch failed, so run each expression on its own to find out which
+    # of them is broken
+    results = []
+    for expr in exprs:
+        try:
+            results.append((conn.execute(f"SELECT {expr}").fetchone()[0], None))
+        except Exception as e:
+            results.append((None, str(e)))
+    return results
+
 def main():
     print("🌟 Simple Astro Extension Test")
     print("=" * 40)
 
+    try:
+        _ensure_duckdb()
+        _ensure_extension()
+    except (ImportError, FileNotFoundError) as e:
+        print(f"❌ {e}")
+        return False
+
     # Test 1: Load extension
     print("🚀 Testing Extension Loading...")
     result = run_duckdb_query("SELECT 'Extension loaded successfully' as status")
-    if result and "successfully" in result:
+    if result and "successfully" in result[0]:
         print("   ✅ Extension loaded successfully")
     else:
         print("   ❌ Failed to load extension")
         return False
 
-    # Test 2: Angular separation
-    print("\n📐 Testing Angular Separation...")
-    result = run_duckdb_query("SELECT angular_separation(0.0, 0.0, 1.0, 1.0) as separation")
-    if result:
-        print(f"   ✅ Angular separation: {result}")
-    else:
-        print("   ❌ Angular separation failed")
-
-    # Test 3: Coordinate conversion
-    print("\n🔄 Testing Coordinate Conversion...")
-    result = run_duckdb_query("SELECT radec_to_cartesian(45.0, 30.0, 10.0) as coords")
-    if result:
-        print(f"   ✅ Coordinate conversion: {result[:100]}...")
-    else:
-        print("   ❌ Coordinate conversion failed")
+    # Tests 2-5 run as a single batched query
+    checks = [
+        ("📐", "Angular Separation", "Angular separation", "astro_angular_separation(0.0, 0.0, 1.0, 1.0)"),
+        ("🔄", "Coordinate Conversion", "Coordinate conversion", "astro_radec_to_xyz(45.0, 30.0, 10.0)"),
+        ("💫", "Magnitude to Flux", "Magnitude to flux", "astro_mag_to_flux(15.5, 25.0)"),
+        ("📏", "Distance Modulus", "Distance modulus", "astro_distance_modulus(1000.0)"),
+    ]
+    results = run_checks([expr for *_, expr in checks])
 
-    # Test 4: Magnitude to flux
-    print("\n💫 Testing Magnitude to Flux...")
-    result = run_duckdb_query("SELECT mag_to_flux(15.5, 25.0) as flux")
-    if result:
-        print(f"   ✅ Magnitude to flux: {result}")
-    else:
-        print("   ❌ Magnitude to flux failed")
-
-    # Test 5: Distance modulus
-    print("\n📏 Testing Distance Modulus...")
-    result = run_duckdb_query("SELECT distance_modulus(1000.0) as dist_mod")
-    if result:
-        print(f"   ✅ Distance modulus: {result}")
-    else:
-        print("   ❌ Distance modulus failed")
+    all_passed = True
+    for (icon, title, label, _), (value, error) in zip(checks, results):
+        print(f"\n{icon} Testing {title}...")
+        if error is None and value is not None:
+            print(f"   ✅ {label}: {str(value)[:100]}")
+        else:
+            print(f"   ❌ {label} failed{f': {error}' if error else ''}")
+            all_passed = False
 
     print("\n🎉 Basic tests completed!")
-    return True
+    return all_passed
 
 if __name__ == "__main__":
     success = main()
@@ -4,11 +4,25 @@ Test Suite for Astro DuckDB Extension
 Tests all 48 astronomical functions
 """
 
+import functools
+import json
+import queue
 import subprocess
 import sys
+import threading
+import time
 from pathlib import Path
 import platform
 
+# Marker printed after every query so the reader knows where its output ends
+_SENTINEL = "---END---"
+# Seconds to wait for a query's output; an unterminated statement (e.g. an
+# unbalanced quote) swallows the sentinel and would otherwise block forever
+_QUERY_TIMEOUT = 10
+_PROC = None
+_OUTPUT = None
+
+@functools.lru_cache(maxsize=1)
 def find_duckdb():
     """Find DuckDB binary for current platform"""
     if platform.system() == "Windows":
@@ -27,34 +41,119 @@ def find_duckdb():
 
     raise FileNotFoundError(f"DuckDB binary not found. Tried: {[str(p) for p in paths]}")
 
-def run_query(query):
-    """Run a DuckDB query and return the output"""
+@functools.lru_cache(maxsize=1)
+def find_extension():
+    """Find the loadable extension build and return its absolute path, if present"""
+    path = Path("build/release/extension/astro/astro.duckdb_extension")
+    return str(path.resolve()) if path.exists() else None
+
+def _pump_output(stream, lines):
+    """Forward CLI output lines to a queue; None marks end of output"""
+    for line in stream:
+        lines.put(line)
+    lines.put(None)
+
+def get_session():
+    """Start the shared DuckDB CLI process and load the extension once"""
+    global _PROC, _OUTPUT
+    if _PROC is not None:
+        return _PROC
+
     duckdb = find_duckdb()
-    result = subprocess.run(
-        [str(duckdb), "-c", query],
-        capture_output=True,
+    _PROC = subprocess.Popen(
+        [str(duckdb), "-json", "-unsigned"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
         text=True,
         encoding='utf-8',
         errors='replace'
     )
-    if result.returncode != 0:
-        raise Exception(f"Query failed: {result.stderr}")
-    return result.stdout.strip() if result.stdout else ""
+    _OUTPUT = queue.Queue()
+    threading.Thread(target=_pump_output, args=(_PROC.stdout, _OUTPUT), daemon=True).start()
 
-def run_query_value(query):
-    """Run query and extract single value from table output"""
-    output = run_query(query)
+    extension = find_extension()
+    if extension is not None:
+        run_query(f"LOAD '{extension}';")
+
+    return _PROC
+
+def close_session():
+    """Shut down the shared DuckDB CLI process"""
+    global _PROC, _OUTPUT
+    if _PROC is None:
+        return
+    _PROC.stdin.close()
+    _PROC.wait()
+    _PROC = None
+    _OUTPUT = None
+
+def reset_session():
+    """Kill the shared DuckDB CLI process; the next query starts a new one"""
+    global _PROC, _OUTPUT
+    if _PROC is None:
+        return
+    _PROC.kill()
+    _PROC.wait()
+    _PROC = None
+    _OUTPUT = None
+
+def run_query(query):
+    """Run a DuckDB query and return the result rows as dicts"""
+    proc = get_session()
+    query = query.strip()
+    if not query.endswith(';'):
+        query += ';'
+    try:
+        proc.stdin.write(f"{query}\n.print {_SENTINEL}\n")
+        proc.stdin.flush()
+    except OSError:
+        reset_session()
+        raise Exception("DuckDB process exited unexpectedly")
+
+    output_lines = _OUTPUT
+    deadline = time.monotonic() + _QUERY_TIMEOUT
+    lines = []
+    while True:
+        try:
+            line = output_lines.get(timeout=max(deadline - time.monotonic(), 0))
+        except queue.Empty:
+            reset_session()
+            raise Exception(f"Query timed out after {_QUERY_TIMEOUT}s (unterminated statement?)")
+        if line is None:
+            reset_session()
+            raise Exception("DuckDB process exited unexpectedly")
+        if line.rstrip('\n') == _SENTINEL:
+            break
+        lines.append(line)
+
+    output = "".join(lines).strip()
     if not output:
-        return ""
-    lines = output.strip().split('\n')
-    # Find the data line (after header and separator)
-    for line in lines:
-        if '│' in line and '───' not in line and '┌' not in line and '└' not in line:
-            # Extract value between │ symbols
-            parts = line.split('│')
-            if len(parts) >= 2:
-                return parts[1].strip()
-    return output
+        return []
+    try:
+        return json.loads(output)
+    except ValueError:
+        raise Exception(f"Query failed: {output}")
+
+def run_query_row(query):
+    """Run query and return the values of the first row in column order"""
+    rows = run_query(query)
+    if not rows:
+        return []
+    return list(rows[0].values())
+
+def run_query_value(query):
+    """Run query and return the first column of the first row"""
+    row = run_query_row(query)
+    return row[0] if row else None
+
+def run_single(expr):
+    """Evaluate one expression, returning (value, error message)"""
+    try:
+        value = run_query_value(f"SELECT {expr};")
+    except Exception as e:
+        return None, str(e)
+    return value, "returned NULL"
 
 def test_group(name, tests):
     """Run a group of tests and return results"""
@@ -65,15 +164,31 @@ def test_group(name, tests):
     passed = 0
     failed = 0
 
-    for test_name, query in tests:
-        try:
-            result = run_query_value(query)
+    # Evaluate the whole group in one SELECT; TRY() turns runtime errors into
+    # NULL, so only binder errors (e.g. a missing function) make it fail and
+    # send us back to running the expressions one by one
+    columns = ", ".join(f"TRY(({expr})) AS t{i}" for i, (_, expr) in enumerate(tests))
+    try:
+        results = run_query_row(f"SELECT {columns};")
+        if len(results) != len(tests):
+            raise ValueError(f"Expected {len(tests)} columns, got {len(results)}")
+    except Exception:
+        results, errors = zip(*(run_single(expr) for _, expr in tests))
+    else:
+        # Re-run only the NULL columns to recover DuckDB's error message
+        results, errors = zip(*(
+            run_single(expr) if result is None else (result, None)
+            for (_, expr), result in zip(tests, results)
+        ))
+
+    for (test_name, _), result, error in zip(tests, results, errors):
+        if result is None:
+            print(f"  [FAIL] {test_name}: {error[:80]}")
+            failed += 1
+        else:
+            result = str(result)
             print(f"  [OK] {test_name}: {result[:60]}{'...' if len(result) > 60 else ''}")
             passed += 1
-        except Exception as e:
-            err_msg = str(e)[:80]
-            print(f"  [FAIL] {test_name}: {err_msg}")
-            failed += 1
 
     return passed, failed
 
@@ -103,90 +218,90 @@ def main():
 
     # Physical Constants
     p, f = test_group("Physical Constants", [
-        ("Speed of light", "SELECT astro_const_c();"),
-        ("Gravitational constant", "SELECT astro_const_G();"),
-        ("Stefan-Boltzmann", "SELECT astro_const_sigma_sb();"),
-        ("AU in meters", "SELECT astro_const_AU();"),
-        ("Parsec in meters", "SELECT astro_const_pc();"),
-        ("Light year in meters", "SELECT astro_const_ly();"),
-        ("Solar mass", "SELECT astro_const_M_sun();"),
-        ("Solar radius", "SELECT astro_const_R_sun();"),
-        ("Solar luminosity", "SELECT astro_const_L_sun();"),
-        ("Earth mass", "SELECT astro_const_M_earth();"),
-        ("Earth radius", "SELECT astro_const_R_earth();"),
+        ("Speed of light", "astro_const_c()"),
+        ("Gravitational constant", "astro_const_G()"),
+        ("Stefan-Boltzmann", "astro_const_sigma_sb()"),
+        ("AU in meters", "astro_const_AU()"),
+        ("Parsec in meters", "astro_const_pc()"),
+        ("Light year in meters", "astro_const_ly()"),
+        ("Solar mass", "astro_const_M_sun()"),
+        ("Solar radius", "astro_const_R_sun()"),
+        ("Solar luminosity", "astro_const_L_sun()"),
+        ("Earth mass", "astro_const_M_earth()"),
+        ("Earth radius", "astro_const_R_earth()"),
     ])
     total_passed += p
     total_failed += f
 
     # Unit Conversions
     p, f = test_group("Unit Conversions", [
-        ("Unit AU (1.0)", "SELECT astro_unit_AU(1.0);"),
-        ("Unit parsec (1.0)", "SELECT astro_unit_pc(1.0);"),
-        ("Unit light year (1.0)", "SELECT astro_unit_ly(1.0);"),
-        ("Unit solar mass (1.0)", "SELECT astro_unit_M_sun(1.0);"),
-        ("Unit Earth mass (1.0)", "SELECT astro_unit_M_earth(1.0);"),
-        ("Length to meters (pc)", "SELECT astro_unit_length_to_m(1.0, 'pc');"),
-        ("Length to meters (AU)", "SELECT astro_unit_length_to_m(1.0, 'AU');"),
-        ("Mass to kg (M_sun)", "SELECT astro_unit_mass_to_kg(1.0, 'M_sun');"),
-        ("Time to seconds (yr)", "SELECT astro_unit_time_to_s(1.0, 'yr');"),
+        ("Unit AU (1.0)", "astro_unit_AU(1.0)"),
+        ("Unit parsec (1.0)", "astro_unit_pc(1.0)"),
+        ("Unit light year (1.0)", "astro_unit_ly(1.0)"),
+        ("Unit solar mass (1.0)", "astro_unit_M_sun(1.0)"),
+        ("Unit Earth mass (1.0)", "astro_unit_M_earth(1.0)"),
+        ("Length to meters (pc)", "astro_unit_length_to_m(1.0, 'pc')"),
+        ("Length to meters (AU)", "astro_unit_length_to_m(1.0, 'AU')"),
+        ("Mass to kg (M_sun)", "astro_unit_mass_to_kg(1.0, 'M_sun')"),
+        ("Time to seconds (yr)", "astro_unit_time_to_s(1.0, 'yr')"),
     ])
     total_passed += p
     total_failed += f
 
     # Coordinate Functions
     p, f = test_group("Coordinate Transformations", [
-        ("Angular separation", "SELECT astro_angular_separation(0.0, 0.0, 1.0, 1.0);"),
-        ("RA/Dec to XYZ", "SELECT astro_radec_to_xyz(45.0, 30.0, 10.0);"),
+        ("Angular separation", "astro_angular_separation(0.0, 0.0, 1.0, 1.0)"),
+        ("RA/Dec to XYZ", "astro_radec_to_xyz(45.0, 30.0, 10.0)"),
     ])
     total_passed += p
     total_failed += f
 
     # Photometry
     p, f = test_group("Photometry", [
-        ("Magnitude to flux", "SELECT astro_mag_to_flux(15.0, 25.0);"),
-        ("Flux to magnitude", "SELECT astro_flux_to_mag(1000.0, 25.0);"),
-        ("Absolute magnitude", "SELECT astro_absolute_mag(10.0, 100.0);"),
-        ("Distance modulus", "SELECT astro_distance_modulus(1000.0);"),
+        ("Magnitude to flux", "astro_mag_to_flux(15.0, 25.0)"),
+        ("Flux to magnitude", "astro_flux_to_mag(1000.0, 25.0)"),
+        ("Absolute magnitude", "astro_absolute_mag(10.0, 100.0)"),
+        ("Distance modulus", "astro_distance_modulus(1000.0)"),
     ])
     total_passed += p
     total_failed += f
 
     # Cosmology
     p, f = test_group("Cosmology", [
-        ("Luminosity distance", "SELECT astro_luminosity_distance(0.1, 70.0);"),
-        ("Comoving distance", "SELECT astro_comoving_distance(1.0, 70.0);"),
+        ("Luminosity distance", "astro_luminosity_distance(0.1, 70.0)"),
+        ("Comoving distance", "astro_comoving_distance(1.0, 70.0)"),
     ])
     total_passed += p
     total_failed += f
 
     # Body Models
     p, f = test_group("Celestial Body Models", [
-        ("Main sequence star (1 M_sun)", "SELECT astro_body_star_ms(1.0);"),
-        ("White dwarf (0.6 M_sun)", "SELECT astro_body_star_white_dwarf(0.6);"),
-        ("Neutron star (1.4 M_sun)", "SELECT astro_body_star_neutron(1.4);"),
-        ("Brown dwarf (50 M_jup)", "SELECT astro_body_brown_dwarf(50.0);"),
-        ("Black hole (10 M_sun)", "SELECT astro_body_black_hole(10.0);"),
-        ("Rocky planet (1 M_earth)", "SELECT astro_body_planet_rocky(1.0);"),
-        ("Gas giant (1 M_jup)", "SELECT astro_body_planet_gas_giant(1.0);"),
-        ("Ice giant (17 M_earth)", "SELECT astro_body_planet_ice_giant(17.0);"),
-        ("Asteroid (500km, 2000 kg/m3)", "SELECT astro_body_asteroid(500.0, 2000.0);"),
+        ("Main sequence star (1 M_sun)", "astro_body_star_ms(1.0)"),
+        ("White dwarf (0.6 M_sun)", "astro_body_star_white_dwarf(0.6)"),
+        ("Neutron star (1.4 M_sun)", "astro_body_star_neutron(1.4)"),
+        ("Brown dwarf (50 M_jup)", "astro_body_brown_dwarf(50.0)"),
+        ("Black hole (10 M_sun)", "astro_body_black_hole(10.0)"),
+        ("Rocky planet (1 M_earth)", "astro_body_planet_rocky(1.0)"),
+        ("Gas giant (1 M_jup)", "astro_body_planet_gas_giant(1.0)"),
+        ("Ice giant (17 M_earth)", "astro_body_planet_ice_giant(17.0)"),
+        ("Asteroid (500km, 2000 kg/m3)", "astro_body_asteroid(500.0, 2000.0)"),
     ])
     total_passed += p
     total_failed += f
 
     # Orbital Mechanics
     p, f = test_group("Orbital Mechanics", [
-        ("Orbit period", "SELECT astro_orbit_period(1.496e11, 1.989e30);"),
-        ("Orbit mean motion", "SELECT astro_orbit_mean_motion(1.496e11, 1.989e30);"),
+        ("Orbit period", "astro_orbit_period(1.496e11, 1.989e30)"),
+        ("Orbit mean motion", "astro_orbit_mean_motion(1.496e11, 1.989e30)"),
         # Complex STRUCT-based functions:
-        ("Orbit make", "SELECT astro_orbit_make(1.496e11, 0.0167, 0.0, 0.0, 0.0, 0.0, 2451545.0, 1.989e30, 'icrs');"),
+        ("Orbit make", "astro_orbit_make(1.496e11, 0.0167, 0.0, 0.0, 0.0, 0.0, 2451545.0, 1.989e30, 'icrs')"),
     ])
     total_passed += p
     total_failed += f
 
     # Spatial Sectors (3D octree, not HEALPix)
     p, f = test_group("Spatial Sectors (Octree)", [
-        ("Sector ID from XYZ", "SELECT astro_sector_id(1.0, 0.0, 0.0, 3);"),
+        ("Sector ID from XYZ", "astro_sector_id(1.0, 0.0, 0.0, 3)"),
     ])
     total_passed += p
     total_failed += f
@@ -207,4 +322,7 @@ def main():
         return 1
 
 if __name__ == "__main__":
-    sys.exit(main())
+    try:
+        sys.exit(main())
+    finally:
+        close_session()